@@ -21,6 +21,8 @@
  *    OFF n [n ...]     : apaga uno o varios relés
  *    TOGGLE n [n ...]  : alterna uno o varios relés
  *    PULSE n ms        : enciende el relé n durante ms milisegundos
+ *    SET hh            : aplica una máscara hex (bit i = relé i) a todos los relés
+ *    ONM/OFFM/TOGM hh  : enciende/apaga/alterna los relés marcados en la máscara hex
  *    ALLON             : enciende todos los relés
  *    ALLOFF            : apaga todos los relés
  *    STATUS            : imprime el estado de todos los relés
@@ -30,6 +32,9 @@
  *  Notas:
  *    - La mayoría de módulos son activos en bajo (LOW = ON).
  *    - Si tu módulo es activo en alto, cambia RELAY_ACTIVE_LOW a false.
+ *    - Los comandos con máscara actualizan los 6 pines con una sola escritura a
+ *      PORTD (D2..D7 = PD2..PD7), sin desfase entre relés. Si cambias los pines,
+ *      pon RELAY_ON_PORTD en false y se aplican pin por pin.
  * ------------------------------------------------------------
  */
 
@@ -39,6 +44,9 @@
 constexpr bool RELAY_ACTIVE_LOW = true;        // true = activo-bajo, false = activo-alto
 constexpr uint8_t RELAY_COUNT   = 6;           // cantidad de canales soportados
 constexpr uint8_t RELAY_PINS[RELAY_COUNT] = {2, 3, 4, 5, 6, 7};
+constexpr bool RELAY_ON_PORTD   = true;        // true = RELAY_PINS son PD2..PD7 (Nano)
+constexpr uint8_t RELAY_PORT_SHIFT = 2;        // bit del relé 0 dentro de PORTD
+constexpr uint8_t RELAY_MASK_ALL   = (1 << RELAY_COUNT) - 1;
 
 enum RelayState : uint8_t { R_OFF = 0, R_ON = 1 };
 RelayState states[RELAY_COUNT];
@@ -67,6 +75,53 @@ void allRelays(RelayState s) {
   }
 }
 
+/**
+ * @brief Máscara con el estado actual (bit i = relé i encendido).
+ */
+uint8_t currentMask() {
+  uint8_t mask = 0;
+  for (uint8_t i = 0; i < RELAY_COUNT; i++) {
+    if (states[i] == R_ON) mask |= (1 << i);
+  }
+  return mask;
+}
+
+/**
+ * @brief Aplica una máscara completa (bit i = relé i encendido) de una vez.
+ */
+void applyMask(uint8_t on) {
+  on &= RELAY_MASK_ALL;
+  for (uint8_t i = 0; i < RELAY_COUNT; i++) {
+    states[i] = (on >> i) & 1 ? R_ON : R_OFF;
+  }
+
+  if (RELAY_ON_PORTD) {
+    // Nivel de cada pin según la polaridad del módulo, alineado a PD2..PD7
+    uint8_t level = RELAY_ACTIVE_LOW ? (uint8_t)(~on & RELAY_MASK_ALL) : on;
+    uint8_t portMask = (uint8_t)(RELAY_MASK_ALL << RELAY_PORT_SHIFT);
+    uint8_t sreg = SREG;
+    cli();  // read-modify-write de PORTD sin que una ISR lo pise
+    PORTD = (PORTD & ~portMask) | (uint8_t)(level << RELAY_PORT_SHIFT);
+    SREG = sreg;
+  } else {
+    for (uint8_t i = 0; i < RELAY_COUNT; i++) {
+      applyRelay(i, states[i]);
+    }
+  }
+}
+
+/**
+ * @brief Lee una máscara hex "hh" (00..3F); false si es inválida.
+ */
+bool parseMask(const String &s, uint8_t &mask) {
+  if (s.length() == 0) return false;
+  char *end = nullptr;
+  long v = strtol(s.c_str(), &end, 16);
+  if (*end != '\0' || v < 0 || v > RELAY_MASK_ALL) return false;
+  mask = (uint8_t)v;
+  return true;
+}
+
 /**
  * @brief Imprime el estado actual de todos los relés.
  */
@@ -87,7 +142,8 @@ void printStatus() {
 void help() {
   Serial.println(F("Comandos disponibles:"));
   Serial.println(F("  ON n [n ...] | OFF n [n ...] | TOGGLE n [n ...]"));
-  Serial.println(F("  PULSE n ms"));
+  Serial.println(F("  PULSE n ms | SET hh (mascara hex, bit i = rele i)"));
+  Serial.println(F("  ONM hh | OFFM hh | TOGM hh (solo los reles de la mascara)"));
   Serial.println(F("  ALLON | ALLOFF | STATUS | HELP | ID"));
   Serial.println(F("  n=0..5, ms=milisegundos (1..60000)"));
 }
@@ -214,6 +270,27 @@ void loop() {
       }
     }
 
+  } else if (cmd == F("SET")) {
+    uint8_t mask = 0;
+    if (!parseMask(rest, mask)) {
+      Serial.println(F("ERR uso: SET hh (00..3F)"));
+    } else {
+      applyMask(mask);
+      printStatus();
+    }
+
+  } else if (cmd == F("ONM") || cmd == F("OFFM") || cmd == F("TOGM")) {
+    uint8_t mask = 0;
+    if (!parseMask(rest, mask)) {
+      Serial.println(F("ERR uso: ONM|OFFM|TOGM hh (00..3F)"));
+    } else {
+      uint8_t cur = currentMask();
+      if (cmd == F("ONM"))       applyMask(cur | mask);
+      else if (cmd == F("OFFM")) applyMask(cur & ~mask);
+      else                       applyMask(cur ^ mask);
+      printStatus();
+    }
+
   } else if (cmd == F("ALLON")) {
     allRelays(R_ON); printStatus();
 
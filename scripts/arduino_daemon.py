@@ -3,39 +3,125 @@
 Arduino Relay Daemon - Mantiene conexión persistente para evitar auto-reset.
 """
 
-import json
+import collections
+import fcntl
 import logging
+import logging.handlers
 import os
+import queue
+import re
+import select
+import selectors
 import signal
 import socket
 import threading
 import time
-from typing import Dict, Any, Optional
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
 
 import serial
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from relay_proto import BATCH_BYTES, FRAME, ID_RE, batch_spans, writev_all
+
 logger = logging.getLogger(__name__)
 
+# Tokens que cierran una respuesta del Arduino
+_TERM_RE = re.compile(rb"STATUS|ERR|OK|RELAY-CTRL")
+
+# Ventanas de espera (s) entre sondeos ID durante el arranque del Arduino
+_HANDSHAKE_BACKOFF = (0.05, 0.1, 0.2, 0.4, 0.8, 1.5)
+
+# Freelist de buffers de socket
+_BUF_SIZE = 1024
+_BUF_POOL_SIZE = 32
+
+# Vocabulario fijo de comandos ya codificado para el puerto serial
+_CMD_BYTES = {
+    f"{op} {ch}": f"{op} {ch}\n".encode('ascii')
+    for op in ("ON", "OFF", "TOGGLE")
+    for ch in range(6)
+}
+_CMD_BYTES.update({cmd: f"{cmd}\n".encode('ascii') for cmd in ("ID", "STATUS", "ALLON", "ALLOFF")})
+
+
+# Protocolo enmarcado para conexiones persistentes (FRAME, longitud "!I" + payload).
+# Un comando de línea empieza siempre con ASCII imprimible, así que un 0x00
+# inicial (longitudes < 16 MiB) identifica a un cliente enmarcado
+_MAX_FRAME = 64 * 1024
+# Buffer de envío por cliente; una respuesta más grande (BATCH) no entra de una
+# vez y el resto se termina de enviar desde el selector (EVENT_WRITE)
+_SNDBUF = 4096
+
+
+class ClientState:
+    """Estado de lectura y envío de un cliente registrado en el selector."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        # None hasta ver el primer byte; True = tramas con longitud, conexión abierta
+        self.framed: Optional[bool] = None
+        # Lo que el socket no aceptó todavía; se vacía en EVENT_WRITE
+        self.outbuf = bytearray()
+
 
 class ArduinoRelayDaemon:
     def __init__(self,
                  arduino_port: str = "/dev/arduino-relay",
-                 socket_path: str = "/tmp/arduino-relay.sock",
-                 pidfile: str = "/tmp/arduino-relay.pid"):
+                 socket_path: str = "\0arduino-relay",
+                 pidfile: str = "/tmp/arduino-relay.pid",
+                 pipeline: bool = False):
 
         self.arduino_port = arduino_port
         self.socket_path = socket_path
         self.pidfile = pidfile
+        self.pipeline = pipeline
+        self._pid_fd: Optional[int] = None
 
         self.arduino: Optional[serial.Serial] = None
+        self._ser_fd: Optional[int] = None
+        # Bytes leídos del Arduino que todavía no pertenecen a ninguna respuesta
+        self._rx = bytearray()
         self.server_socket: Optional[socket.socket] = None
         self.running = False
-        self.arduino_lock = threading.Lock()
+
+        # El hilo serial es el único dueño del Arduino: (comando, Future) entran
+        # por _cmd_q y las respuestas listas vuelven al selector por _replies
+        self.selector: Optional[selectors.BaseSelector] = None
+        self._cmd_q: "queue.Queue" = queue.Queue()
+        self._replies: collections.deque = collections.deque()
+
+        # Buffers reutilizables para recv_into/send (solo los usa el selector)
+        self._buf_pool: collections.deque = collections.deque(
+            bytearray(_BUF_SIZE) for _ in range(_BUF_POOL_SIZE))
+        self._serial_thread: Optional[threading.Thread] = None
+        self._wake_r: Optional[int] = None
+        self._wake_w: Optional[int] = None
 
     def start(self):
         """Inicia el daemon."""
-        if self._is_already_running():
+        # Los registros se encolan y un hilo aparte los escribe en stderr: el hilo
+        # serial nunca se bloquea esperando a la consola. Solo mientras corre el
+        # daemon y solo en su logger; el root de quien lo importe queda intacto
+        log_queue: "queue.Queue" = queue.Queue()
+        stream = logging.StreamHandler()
+        stream.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        listener = logging.handlers.QueueListener(log_queue, stream)
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        level, propagate = logger.level, logger.propagate
+        logger.addHandler(queue_handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        listener.start()
+        try:
+            return self._run()
+        finally:
+            listener.stop()
+            logger.removeHandler(queue_handler)
+            logger.setLevel(level)
+            logger.propagate = propagate
+
+    def _run(self):
+        if not self._acquire_pidfile():
             logger.error("Daemon already running")
             return False
 
@@ -47,121 +133,531 @@ class ArduinoRelayDaemon:
         if not self._setup_socket():
             return False
 
-        # Escribir PID
-        with open(self.pidfile, 'w') as f:
-            f.write(str(os.getpid()))
+        # Escribir PID (el lock ya lo tenemos desde _acquire_pidfile)
+        os.ftruncate(self._pid_fd, 0)
+        os.write(self._pid_fd, str(os.getpid()).encode('ascii'))
 
-        # Signal handlers
+        # Signal handlers: set_wakeup_fd despierta al selector en cuanto llega la señal
+        signal.set_wakeup_fd(self._wake_w)
         signal.signal(signal.SIGTERM, self._shutdown)
         signal.signal(signal.SIGINT, self._shutdown)
 
         self.running = True
-        logger.info(f"Arduino Relay Daemon started (PID: {os.getpid()})")
+        logger.info("Arduino Relay Daemon started (PID: %d)", os.getpid())
+
+        # Un único hilo habla con el Arduino; el selector nunca bloquea en serial
+        self._serial_thread = threading.Thread(target=self._serial_worker, daemon=True)
+        self._serial_thread.start()
 
         # Main loop
         self._main_loop()
+        self._cleanup()
 
     def _connect_arduino(self) -> bool:
         try:
-            self.arduino = serial.Serial(
-                port=self.arduino_port,
-                baudrate=115200,
-                timeout=2.0
-            )
-
-            # Esperar reset inicial (solo una vez)
-            time.sleep(3)
-            self.arduino.reset_input_buffer()
-            self.arduino.reset_output_buffer()
-
-            # Verificar conexión
-            self.arduino.write(b"ID\n")
-            response = self.arduino.readline().decode('utf-8', errors='ignore')
-
-            if "RELAY-CTRL" in response:
-                logger.info(f"Arduino connected: {response.strip()}")
+            # DTR bajo apenas abierto; en Linux el open() ya pudo resetear la placa,
+            # el handshake espera a que conteste
+            self.arduino = serial.Serial(baudrate=115200, timeout=2.0, dsrdtr=False)
+            self.arduino.port = self.arduino_port
+            self.arduino.dtr = False
+            self.arduino.open()
+            self._ser_fd = self.arduino.fileno()
+
+            # Verificar conexión (espera activa en lugar de un sleep fijo)
+            response = self._handshake()
+
+            if response:
+                logger.info("Arduino connected: %s", response.decode('utf-8', errors='ignore'))
                 return True
             else:
-                logger.error(f"Invalid Arduino response: {response}")
+                logger.error("Invalid Arduino response: no ID reply within handshake window")
                 return False
 
         except Exception as e:
-            logger.error(f"Failed to connect Arduino: {e}")
+            logger.error("Failed to connect Arduino: %s", e)
             return False
 
+    def _handshake(self) -> Optional[bytes]:
+        """Sondea ID con backoff hasta que el Arduino responda o se agote el plazo."""
+        timeout = self.arduino.timeout
+        self.arduino.timeout = 0.05
+        try:
+            buf = bytearray()
+            for attempt, window in enumerate(_HANDSHAKE_BACKOFF):
+                self.arduino.write(b"ID\n")
+                deadline = time.monotonic() + window
+                while time.monotonic() < deadline:
+                    buf += self.arduino.read(self.arduino.in_waiting or 1)
+                    match = ID_RE.search(buf)
+                    if match:
+                        # Solo hay restos de sondeos anteriores si hubo reintentos
+                        if attempt and self.arduino.in_waiting:
+                            self.arduino.reset_input_buffer()
+                        return match.group(1)
+            return None
+        finally:
+            self.arduino.timeout = timeout
+
     def _setup_socket(self) -> bool:
         try:
-            if os.path.exists(self.socket_path):
+            # Socket abstracto ("\0..."): sin archivo que borrar ni permisos que ajustar
+            abstract = self.socket_path.startswith("\0")
+            if not abstract and os.path.exists(self.socket_path):
                 os.unlink(self.socket_path)
 
             self.server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
             self.server_socket.bind(self.socket_path)
-            self.server_socket.listen(5)
-            os.chmod(self.socket_path, 0o666)
-
-            logger.info(f"Socket created: {self.socket_path}")
+            self.server_socket.listen(socket.SOMAXCONN)
+            self.server_socket.setblocking(False)
+            if not abstract:
+                os.chmod(self.socket_path, 0o666)
+
+            # Socket de escucha + pipe de despertar (señales y respuestas listas)
+            # dentro del mismo selector
+            self.selector = selectors.DefaultSelector()
+            self.selector.register(self.server_socket, selectors.EVENT_READ, data=None)
+            self._wake_r, self._wake_w = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+            self.selector.register(self._wake_r, selectors.EVENT_READ, data=self._wake_r)
+
+            logger.info("Socket created: %s", self.socket_path.replace(chr(0), '@'))
             return True
 
         except Exception as e:
-            logger.error(f"Failed to create socket: {e}")
+            logger.error("Failed to create socket: %s", e)
             return False
 
     def _main_loop(self):
         while self.running:
             try:
-                self.server_socket.settimeout(1.0)
+                events = self.selector.select(timeout=None)
+            except OSError as e:
+                if self.running:
+                    logger.error("Main loop error: %s", e)
+                break
+
+            for key, mask in events:
+                if key.data is None:
+                    self._accept_client()
+                elif key.data is self._wake_r:
+                    self._drain_wakeup()
+                    self._send_replies()
+                else:
+                    if mask & selectors.EVENT_WRITE:
+                        self._flush_client(key.fileobj, key.data)
+                    if mask & selectors.EVENT_READ and key.fileobj.fileno() >= 0:
+                        self._read_client(key.fileobj, key.data)
+
+        self._cmd_q.put(None)
+
+    def _accept_client(self):
+        # Vaciar todo el backlog en una sola vuelta del selector
+        while True:
+            try:
+                client, _ = self.server_socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                if self.running:
+                    logger.error("Accept error: %s", e)
+                return
+            client.setblocking(False)
+            # Las respuestas son de decenas de bytes: no reservar el buffer por defecto
+            client.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, _SNDBUF)
+            state = ClientState()
+            self.selector.register(client, selectors.EVENT_READ, data=state)
+            # El cliente suele escribir antes de que lo aceptemos: leer ya
+            # ahorra una vuelta extra por select()
+            self._read_client(client, state)
+
+    def _drain_wakeup(self):
+        try:
+            while os.read(self._wake_r, 64):
+                pass
+        except OSError:
+            pass
+
+    def _take_buffer(self) -> bytearray:
+        return self._buf_pool.popleft() if self._buf_pool else bytearray(_BUF_SIZE)
+
+    def _read_client(self, client: socket.socket, state: ClientState):
+        buf = self._take_buffer()
+        try:
+            n = client.recv_into(buf, _BUF_SIZE)
+        except (BlockingIOError, InterruptedError):
+            self._buf_pool.append(buf)
+            return
+        except OSError as e:
+            logger.error("Client error: %s", e)
+            n = 0
+
+        if n:
+            with memoryview(buf) as view:
+                state.buffer += view[:n]
+        self._buf_pool.append(buf)
+
+        if state.framed is None and state.buffer:
+            state.framed = state.buffer[0] == 0
+        if state.framed:
+            self._read_frames(client, state, eof=not n)
+            return
+
+        if n:
+            if b"\n" not in state.buffer:
+                return
+            line = bytes(state.buffer.split(b"\n", 1)[0])
+        else:
+            # EOF: procesar lo que haya quedado sin terminador
+            line = bytes(state.buffer)
+
+        command = line.strip().decode('ascii', errors='replace')
+        if command == "BATCH":
+            # "BATCH\n<cmd>\n...\n.\n": esperar el "." (o EOF) y encolar todo junto
+            commands = self._parse_batch(state.buffer, eof=not n)
+            if commands is None:
+                return
+            command = tuple(commands)
+
+        self.selector.unregister(client)
+        if command == "":
+            client.close()
+            return
+
+        future: Future = Future()
+        future.add_done_callback(
+            lambda f, client=client: self._reply_ready(client, state, f))
+        self._cmd_q.put((command, future))
+
+    def _read_frames(self, client: socket.socket, state: ClientState, eof: bool):
+        """Encola cada trama completa; la conexión sigue registrada para la siguiente."""
+        buf = state.buffer
+        while len(buf) >= FRAME.size:
+            (length,) = FRAME.unpack_from(buf)
+            if length > _MAX_FRAME:
+                logger.error("Client error: frame too large (%d bytes)", length)
+                self._drop_client(client)
+                return
+            end = FRAME.size + length
+            if len(buf) < end:
+                break
+            payload = bytes(buf[FRAME.size:end])
+            del buf[:end]
+
+            command = payload.strip().decode('ascii', errors='replace')
+            if command.startswith("BATCH\n"):
+                command = tuple(self._parse_batch(bytearray(payload), eof=True))
+
+            future: Future = Future()
+            future.add_done_callback(
+                lambda f, client=client: self._reply_ready(client, state, f))
+            self._cmd_q.put((command, future))
+
+        if eof:
+            self._drop_client(client)
+
+    def _drop_client(self, client: socket.socket):
+        try:
+            self.selector.unregister(client)
+        except (KeyError, ValueError):
+            pass
+        client.close()
+
+    @staticmethod
+    def _parse_batch(buffer: bytearray, eof: bool) -> Optional[List[str]]:
+        """Comandos de un BATCH ya completo, o None si todavía falta el "."."""
+        lines = bytes(buffer).split(b"\n")[1:]
+        if not eof:
+            lines.pop()  # la última puede estar a medias
+        commands = []
+        for line in lines:
+            line = line.strip()
+            if line == b".":
+                return commands
+            if line:
+                commands.append(line.decode('ascii', errors='replace'))
+        return commands if eof else None
+
+    def _serial_worker(self):
+        """Consume (comando, Future) de la cola y ejecuta cada uno en el Arduino."""
+        if self.pipeline:
+            self._pipeline_worker()
+            return
+        while True:
+            item = self._cmd_q.get()
+            if item is None:
+                break
+            command, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            if isinstance(command, tuple):
+                future.set_result(self._execute_many([self._encode(c) for c in command]))
+            else:
+                future.set_result(self._execute_command(command))
+
+    def _pipeline_worker(self):
+        """Como _serial_worker, pero agrupa lo ya encolado en lotes de un solo write()."""
+        pending = None
+        while True:
+            item = pending if pending is not None else self._cmd_q.get()
+            pending = None
+            if item is None:
+                break
+            batch = []
+            size = 0
+            while item is not None:
+                command, future = item
+                if isinstance(command, tuple):
+                    # Un BATCH del cliente ya viene agrupado: se ejecuta aparte
+                    if batch:
+                        pending = item
+                        break
+                    if future.set_running_or_notify_cancel():
+                        future.set_result(self._execute_many([self._encode(c) for c in command]))
+                else:
+                    data = self._encode(command)
+                    # El lote debe caber en el buffer RX de 64 bytes del Arduino
+                    if batch and size + len(data) > BATCH_BYTES:
+                        pending = item
+                        break
+                    if future.set_running_or_notify_cancel():
+                        batch.append((data, future))
+                        size += len(data)
                 try:
-                    client, _ = self.server_socket.accept()
-                    threading.Thread(target=self._handle_client, args=(client,), daemon=True).start()
-                except socket.timeout:
-                    continue
+                    item = self._cmd_q.get_nowait()
+                except queue.Empty:
+                    break
+            else:
+                # Llegó el None de cierre: despachar lo juntado y terminar
+                self._execute_batch(batch)
+                break
+            self._execute_batch(batch)
+
+    def _execute_batch(self, batch: list):
+        """Resuelve cada Future del lote con su respuesta, en orden."""
+        if not batch:
+            return
+        results = self._execute_many([data for data, _ in batch])
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _execute_many(self, payloads: List[bytes]) -> List[Tuple[bool, bytes]]:
+        """writev() de los comandos en tramos que quepan en el RX del Arduino y una
+        respuesta por comando, en orden."""
+        if not payloads:
+            # "BATCH\n.\n": contestar el error como cualquier otro, no cerrar en silencio
+            return [(False, b"empty batch")]
+        results: List[Tuple[bool, bytes]] = []
+        for start, end in batch_spans(payloads):
+            self._rx.clear()
+            try:
+                writev_all(self._ser_fd, payloads[start:end], self.arduino.write)
+                for _ in range(start, end):
+                    response = self._read_response()
+                    results.append((bool(response) and b"ERR" not in response, response))
             except Exception as e:
-                if self.running:
-                    logger.error(f"Main loop error: {e}")
+                error = (False, str(e).encode('utf-8', errors='replace'))
+                results.extend([error] * (end - len(results)))
+        return results
+
+    def _reply_ready(self, client: socket.socket, state: ClientState, future: Future):
+        # Corre en el hilo serial: encolar y despertar al selector
+        self._replies.append((client, state, future.result()))
+        self._wake()
+
+    def _send_replies(self):
+        # Protocolo de línea: "<comando>\n" -> "OK <respuesta>\n" | "ERR <motivo>\n";
+        # un BATCH recibe una de esas líneas por comando. Los clientes enmarcados
+        # reciben lo mismo dentro de una trama y la conexión queda abierta
+        while self._replies:
+            client, state, result = self._replies.popleft()
+            if client.fileno() < 0:
+                continue  # el cliente enmarcado ya cerró
+            try:
+                if state.framed:
+                    self._send_frame(client, state, result)
+                    continue
+                if isinstance(result, list):
+                    self._sendall(client, state, self._format_batch(result))
+                else:
+                    success, response = result
+                    self._send_reply(client, state, b"OK " if success else b"ERR ", response)
+                if not state.outbuf:
+                    client.close()  # línea: una respuesta y se cierra
+            except OSError as e:
+                logger.error("Client error: %s", e)
+                self._drop_client(client)
+
+    @staticmethod
+    def _format_batch(results: List[Tuple[bool, bytes]]) -> bytes:
+        return b"".join(
+            (b"OK " if success else b"ERR ") + response.replace(b"\n", b" ") + b"\n"
+            for success, response in results)
+
+    def _send_frame(self, client: socket.socket, state: ClientState, result):
+        if isinstance(result, list):
+            data = self._format_batch(result)
+        else:
+            success, response = result
+            data = (b"OK " if success else b"ERR ") + response
+        self._sendall(client, state, FRAME.pack(len(data)) + data)
+
+    def _sendall(self, client: socket.socket, state: ClientState, data):
+        """Envía sin bloquear; lo que no entra queda en outbuf para EVENT_WRITE."""
+        if state.outbuf:
+            state.outbuf += data  # hay algo pendiente: respetar el orden
+            return
+        try:
+            sent = client.send(data, socket.MSG_NOSIGNAL)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        if sent == len(data):
+            return
+        state.outbuf += data[sent:]
+        if state.framed:
+            self.selector.modify(client, selectors.EVENT_READ | selectors.EVENT_WRITE, data=state)
+        else:
+            # El cliente de línea ya no estaba registrado (se leyó su comando)
+            self.selector.register(client, selectors.EVENT_WRITE, data=state)
 
-    def _handle_client(self, client: socket.socket):
+    def _flush_client(self, client: socket.socket, state: ClientState):
         try:
-            with client:
-                data = client.recv(1024)
-                if data:
-                    request = json.loads(data.decode('utf-8'))
-                    response = self._execute_command(request.get("command", ""))
-                    client.send(json.dumps(response).encode('utf-8'))
-        except Exception as e:
-            logger.error(f"Client error: {e}")
+            sent = client.send(state.outbuf, socket.MSG_NOSIGNAL)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            logger.error("Client error: %s", e)
+            self._drop_client(client)
+            return
+        del state.outbuf[:sent]
+        if state.outbuf:
+            return
+        if state.framed:
+            self.selector.modify(client, selectors.EVENT_READ, data=state)
+        else:
+            self._drop_client(client)
+
+    def _send_reply(self, client: socket.socket, state: ClientState,
+                    prefix: bytes, response: bytes):
+        # Una respuesta por línea, como en BATCH: la firmware puede contestar en
+        # varias (p.ej. "WARN ..." + "STATUS ...")
+        response = response.replace(b"\n", b" ")
+        # Armar la respuesta dentro de un buffer del pool en lugar de concatenar
+        end = len(prefix) + len(response) + 1
+        if end > _BUF_SIZE:
+            self._sendall(client, state, prefix + response + b"\n")
+            return
+
+        buf = self._take_buffer()
+        try:
+            with memoryview(buf) as view:
+                mid = len(prefix)
+                view[:mid] = prefix
+                view[mid:end - 1] = response
+                view[end - 1] = 0x0A  # "\n"
+                self._sendall(client, state, view[:end])
+        finally:
+            self._buf_pool.append(buf)
+
+    def _wake(self):
+        try:
+            os.write(self._wake_w, b"\0")
+        except OSError:
+            pass
 
-    def _execute_command(self, command: str) -> Dict[str, Any]:
+    def _execute_command(self, command: str) -> Tuple[bool, bytes]:
         if not command:
-            return {"success": False, "error": "No command"}
-
-        try:
-            with self.arduino_lock:
-                self.arduino.write(f"{command}\n".encode('utf-8'))
-                self.arduino.flush()
-
-                # Leer respuesta
-                lines = []
-                for _ in range(10):
-                    line = self.arduino.readline().decode('utf-8', errors='ignore').strip()
-                    if line:
-                        lines.append(line)
-                        if any(term in line for term in ["STATUS", "ERR", "OK", "RELAY-CTRL"]):
-                            break
-                    else:
-                        break
+            return False, b"No command"
 
-                response = '\n'.join(lines)
-                success = response and "ERR" not in response
+        try:
+            # Sin pipeline, lo que haya quedado de antes es basura
+            self._rx.clear()
+            self._write(self._encode(command))
 
-                return {"success": success, "response": response}
+            response = self._read_response()
+            success = bool(response) and b"ERR" not in response
+
+            return success, response
 
         except Exception as e:
-            return {"success": False, "error": str(e)}
+            return False, str(e).encode('utf-8', errors='replace')
+
+    @staticmethod
+    def _encode(command: str) -> bytes:
+        return _CMD_BYTES.get(command) or f"{command}\n".encode('utf-8')
+
+    def _write(self, data: bytes):
+        # Un comando cabe entero en el buffer del tty: os.write directo, sin el
+        # select() previo ni el tcdrain() de flush() que agrega pyserial
+        try:
+            written = os.write(self._ser_fd, data)
+        except BlockingIOError:
+            written = 0
+        if written < len(data):
+            self.arduino.write(data[written:])
+
+    def _read_response(self) -> bytes:
+        """Lee en bloque hasta la primera línea terminal o hasta el timeout."""
+        # Atributos resueltos una sola vez fuera de los bucles
+        fd = self._ser_fd
+        search = _TERM_RE.search
+        monotonic = time.monotonic
+
+        # select() + os.read() sobre el fd: cada despertar trae todo lo que haya
+        # llegado, en vez del read(1) byte a byte de pyserial. Lo que sobre tras
+        # la línea terminal queda en _rx para la respuesta siguiente (pipeline)
+        buf = self._rx
+        deadline = monotonic() + (self.arduino.timeout or 0)
+        end = self._terminal_end(buf, search)
+        while end < 0:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                break
+            try:
+                chunk = os.read(fd, 256)
+            except BlockingIOError:
+                continue
+            if not chunk:
+                raise serial.SerialException("Arduino disconnected (read returned no data)")
+            buf += chunk
+            end = self._terminal_end(buf, search)
+
+        if end < 0:
+            end = len(buf)
+        lines = []
+        for line in bytes(buf[:end]).splitlines():
+            line = line.strip()
+            if line:
+                lines.append(line)
+        del buf[:end]
+        return b'\n'.join(lines)
+
+    @staticmethod
+    def _terminal_end(buf: bytearray, search) -> int:
+        """Posición justo después de la primera línea completa con terminal, o -1."""
+        match = search(buf)
+        if not match:
+            return -1
+        nl = buf.find(b"\n", match.end())
+        return nl + 1 if nl >= 0 else -1
 
     def _shutdown(self, signum=None, frame=None):
+        # El selector ya fue despertado vía set_wakeup_fd; solo marcar la salida
         logger.info("Shutting down...")
         self.running = False
 
+    def _cleanup(self):
+        """Libera recursos una vez que terminó el main loop."""
+        # Dejar que el hilo serial termine el comando en curso antes de cerrar
+        if self._serial_thread:
+            self._serial_thread.join(timeout=5.0)
+
+        signal.set_wakeup_fd(-1)
+        self.selector.close()
+        for fd in (self._wake_r, self._wake_w):
+            os.close(fd)
+
         if self.arduino and self.arduino.is_open:
             self.arduino.close()
 
@@ -169,20 +665,33 @@ class ArduinoRelayDaemon:
             self.server_socket.close()
 
         for path in [self.socket_path, self.pidfile]:
-            if os.path.exists(path):
+            if not path.startswith("\0") and os.path.exists(path):
                 os.unlink(path)
 
+    def _acquire_pidfile(self) -> bool:
+        """Toma el lock exclusivo del pidfile; el kernel lo libera si el proceso muere."""
+        fd = os.open(self.pidfile, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._pid_fd = fd
+        return True
+
     def _is_already_running(self) -> bool:
-        if not os.path.exists(self.pidfile):
+        try:
+            fd = os.open(self.pidfile, os.O_RDONLY)
+        except FileNotFoundError:
             return False
         try:
-            with open(self.pidfile, 'r') as f:
-                pid = int(f.read().strip())
-            os.kill(pid, 0)  # Check if process exists
-            return True
-        except:
-            os.unlink(self.pidfile)
+            # Si el daemon tiene el lock exclusivo, uno compartido no entra
+            fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
             return False
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(fd)
 
 
 def main():
@@ -191,14 +700,19 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("action", choices=["start", "stop", "status"])
     parser.add_argument("--port", default="/dev/arduino-relay")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Write queued commands to the Arduino in one batch")
 
     args = parser.parse_args()
 
-    daemon = ArduinoRelayDaemon(arduino_port=args.port)
+    daemon = ArduinoRelayDaemon(arduino_port=args.port, pipeline=args.pipeline)
 
     if args.action == "start":
         daemon.start()
     elif args.action == "stop":
+        if not daemon._is_already_running():
+            print("Daemon is not running")
+            return
         try:
             with open("/tmp/arduino-relay.pid", 'r') as f:
                 pid = int(f.read().strip())
@@ -1,51 +1,223 @@
 #!/usr/bin/env python3
 """
 Arduino Relay Control Script - Version with persistent connection cache
+
+Solo POSIX: el puerto se lee con select() sobre su fd y el lock usa fcntl.
 """
 
-import argparse
+from __future__ import annotations
+
+import errno
 import fcntl
 import logging
-import serial
+import os
+import re
+import select
 import sys
 import time
-from enum import IntEnum
-from typing import Optional, Dict, Any, Iterable, List
+import types
+from functools import lru_cache
+from typing import (TYPE_CHECKING, Optional, Dict, Any, Final, Iterable, List,
+                    Tuple, Union)
 
 import socket
-import json
+import struct
+import termios
+
+from relay_proto import FRAME, ID_RE, batch_spans, writev_all
+
+if TYPE_CHECKING:
+    import argparse
+    import serial
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
-class RelayChannel(IntEnum):
-    CHANNEL_0 = 0
-    CHANNEL_1 = 1
-    CHANNEL_2 = 2
-    CHANNEL_3 = 3
-    CHANNEL_4 = 4
-    CHANNEL_5 = 5
+# Plazo para la respuesta de un comando (s); PULSE le suma su duración.
+# Una placa sana contesta en pocos ms: no tiene sentido esperar los 2 s del timeout
+_REPLY_DEADLINE = 0.25
+
+# Sondeo de disponibilidad al abrir el puerto (s): un ID cada ~100 ms
+_READY_DEADLINE = 2.5
+_PROBE_TIMEOUT = 0.05
+_PROBE_INTERVAL = 0.05
+
+# Canales válidos, compartidos por argparse y la validación
+_CHANNELS = (0, 1, 2, 3, 4, 5)
+_CHANNEL_SET = frozenset(_CHANNELS)
 
+# "n:OFF"/"n:ON" ya codificados, indexados por canal y estado
+_STATE_TOKENS = tuple((b"%d:OFF" % c, b"%d:ON" % c) for c in _CHANNELS)
 
+# Inversa para parsear "STATUS 0:OFF 1:ON ... 5:OFF": token -> (canal, encendido).
+# La firmware imprime siempre ON/OFF en mayúsculas, no hace falta upper()
+_TOKEN_STATE = {tok: (c, bool(on)) for c, pair in zip(_CHANNELS, _STATE_TOKENS)
+                for on, tok in enumerate(pair)}
+
+# Alias por compatibilidad: RelayChannel.CHANNEL_n sigue valiendo n
+RelayChannel = types.SimpleNamespace(**{f"CHANNEL_{c}": c for c in _CHANNELS})
+
+
+# Tokens del protocolo en bytes: se escriben y comparan tal cual, sin encode()
 class ArduinoCommands:
-    ID = "ID"
-    ON = "ON"
-    OFF = "OFF"
-    TOGGLE = "TOGGLE"
-    PULSE = "PULSE"
-    STATUS = "STATUS"
-    ALL_OFF = "ALLOFF"
-    ALL_ON = "ALLON"
+    ID: Final[bytes] = b"ID"
+    ON: Final[bytes] = b"ON"
+    OFF: Final[bytes] = b"OFF"
+    TOGGLE: Final[bytes] = b"TOGGLE"
+    PULSE: Final[bytes] = b"PULSE"
+    STATUS: Final[bytes] = b"STATUS"
+    ALL_OFF: Final[bytes] = b"ALLOFF"
+    ALL_ON: Final[bytes] = b"ALLON"
+    SET: Final[bytes] = b"SET"  # SET hh: la firmware aplica la máscara (bit i = relé i) en una pasada
+    # Solo los relés marcados en la máscara, con una única escritura de puerto
+    ON_MASK: Final[bytes] = b"ONM"
+    OFF_MASK: Final[bytes] = b"OFFM"
+    TOGGLE_MASK: Final[bytes] = b"TOGM"
 
 
 class ArduinoResponses:
-    DEVICE_ID = "RELAY-CTRL"
-    STATUS_OK = "STATUS"
-    ERROR = "ERR"
-    OK = "OK"
+    DEVICE_ID: Final[bytes] = b"RELAY-CTRL"
+    STATUS_OK: Final[bytes] = b"STATUS"
+    ERROR: Final[bytes] = b"ERR"
+    OK: Final[bytes] = b"OK"
+
+
+# Tokens que cierran una respuesta del Arduino, en una sola pasada de re (en C)
+_TERM_RE = re.compile(b"|".join(re.escape(t) for t in (
+    ArduinoResponses.STATUS_OK, ArduinoResponses.ERROR,
+    ArduinoResponses.OK, ArduinoResponses.DEVICE_ID)))
+
+# Respuesta exitosa: alguno de estos y ningún ERR
+_SUCCESS_RE = re.compile(b"|".join(re.escape(t) for t in (
+    ArduinoResponses.STATUS_OK, ArduinoResponses.OK, ArduinoResponses.DEVICE_ID)))
+
+# Comandos fijos ya codificados, listos para escribir al puerto
+_CMD_BYTES = {name: name + b"\n" for name in (
+    ArduinoCommands.ID, ArduinoCommands.STATUS, ArduinoCommands.ALL_ON, ArduinoCommands.ALL_OFF)}
+# Y los de un solo canal: 3 ops x 6 canales, indexados por (op, canal)
+_CMD_BYTES.update({(op, c): b"%s %d\n" % (op, c)
+                   for op in (ArduinoCommands.ON, ArduinoCommands.OFF, ArduinoCommands.TOGGLE)
+                   for c in _CHANNELS})
+
+
+@lru_cache(maxsize=256)
+def _fmt_mask(op: bytes, mask: int) -> bytes:
+    """Codifica "OP hh\\n" para los comandos con máscara (64 valores posibles por op)."""
+    return b"%s %02X\n" % (op, mask)
+
+
+# Operación agrupada -> comando de máscara
+_MASK_OPS = {'on': ArduinoCommands.ON_MASK, 'off': ArduinoCommands.OFF_MASK,
+             'toggle': ArduinoCommands.TOGGLE_MASK}
+
+
+def _channel_mask(channels: Iterable[int]) -> int:
+    mask = 0
+    for c in channels:
+        mask |= 1 << c
+    return mask
+
+
+def _serial():
+    """Importa pyserial recién al usarlo: el camino vía daemon no lo necesita."""
+    import serial
+    return serial
+
+
+class _RawSerial:
+    """
+    Puerto serie sobre el fd crudo (os.open + termios), sin pasar por pyserial.
+
+    Expone solo lo que usa PersistentArduinoController: write, read, in_waiting,
+    reset_input_buffer, fileno y close.
+    """
+
+    def __init__(self, port: str, baudrate: int, timeout: float, write_timeout: float):
+        self.port = port
+        self.timeout = timeout
+        self.write_timeout = write_timeout
+        speed = getattr(termios, f"B{baudrate}", None)
+        if speed is None:
+            raise _serial().SerialException(f"Unsupported baudrate for raw mode: {baudrate}")
+
+        self._fd = os.open(port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        try:
+            # 8N1 crudo, sin eco ni traducciones; VMIN/VTIME en 0 porque la espera
+            # la hace select()
+            attrs = termios.tcgetattr(self._fd)
+            attrs[0] = 0                                                # iflag
+            attrs[1] = 0                                                # oflag
+            attrs[2] = speed | termios.CS8 | termios.CREAD | termios.CLOCAL  # cflag
+            attrs[3] = 0                                                # lflag
+            attrs[4] = attrs[5] = speed
+            attrs[6][termios.VMIN] = 0
+            attrs[6][termios.VTIME] = 0
+            termios.tcsetattr(self._fd, termios.TCSANOW, attrs)
+        except termios.error as e:
+            os.close(self._fd)
+            raise _serial().SerialException(f"Could not configure {port}: {e}")
+
+        # Igual que pyserial con dtr=False: bajar DTR apenas abierto
+        try:
+            fcntl.ioctl(self._fd, termios.TIOCMBIC, struct.pack('I', termios.TIOCM_DTR))
+        except OSError:
+            pass  # los pty no tienen líneas de módem
+
+    @property
+    def is_open(self) -> bool:
+        return self._fd is not None
+
+    @property
+    def in_waiting(self) -> int:
+        buf = fcntl.ioctl(self._fd, termios.FIONREAD, b"\0\0\0\0")
+        return struct.unpack('I', buf)[0]
+
+    def fileno(self) -> int:
+        return self._fd
+
+    def write(self, data: bytes) -> int:
+        fd = self._fd
+        # Caso normal: el comando entra entero en el buffer del tty y se escribe
+        # el bytes precodificado tal cual, sin memoryview ni copias
+        try:
+            n = os.write(fd, data)
+        except BlockingIOError:
+            n = 0
+        if n == len(data):
+            return n
+
+        view = memoryview(data)[n:]
+        deadline = time.monotonic() + (self.write_timeout or 0)
+        while view:
+            try:
+                n = os.write(fd, view)
+            except BlockingIOError:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not select.select([], [fd], [], remaining)[1]:
+                    raise _serial().SerialTimeoutException("Write timeout")
+                continue
+            view = view[n:]
+        return len(data)
+
+    def read(self, size: int = 1) -> bytes:
+        """Devuelve lo disponible (hasta size) o b'' si vence el timeout."""
+        fd = self._fd
+        if not select.select([fd], [], [], self.timeout)[0]:
+            return b""
+        try:
+            data = os.read(fd, size)
+        except BlockingIOError:
+            return b""
+        if not data:
+            raise _serial().SerialException("Arduino disconnected (read returned no data)")
+        return data
+
+    def reset_input_buffer(self) -> None:
+        termios.tcflush(self._fd, termios.TCIFLUSH)
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
 
 
 class PersistentArduinoController:
@@ -54,73 +226,156 @@ class PersistentArduinoController:
     para evitar el auto-reset del Arduino.
     """
     
-    _instance = None
+    # Una instancia por puerto: abrir un segundo puerto no descarta la
+    # conexión (ni el lock) del primero
+    _instances: Dict[str, PersistentArduinoController] = {}
     _connection = None
     _lockfile = None
+    _fd = None  # fd del puerto abierto, resuelto una vez
     
-    def __new__(cls, port: str = '/dev/arduino-relay', baudrate: int = 115200):
-        # Singleton por puerto
-        if cls._instance is None or cls._instance.port != port:
-            cls._instance = super().__new__(cls)
-            cls._instance.port = port
-            cls._instance.baudrate = baudrate
-            cls._instance.timeout = 2.0
-            cls._instance._lockfile_path = f"/tmp/arduino-relay-{port.replace('/', '_')}.lock"
-        return cls._instance
+    def __init__(self, port: str = '/dev/arduino-relay', baudrate: int = 115200,
+                 low_latency: bool = True, fast: bool = False):
+        self.port = port
+        self.baudrate = baudrate
+        self.low_latency = low_latency
+        self.fast = fast
+        self.timeout = 2.0
+        self._lockfile_path = f"/tmp/arduino-relay-{port.replace('/', '_')}.lock"
+
+    @classmethod
+    def get_instance(cls, port: str = '/dev/arduino-relay', baudrate: int = 115200,
+                     low_latency: bool = True, fast: bool = False) -> PersistentArduinoController:
+        """
+        Devuelve la instancia del puerto, creándola la primera vez. Si se pide con
+        otra configuración, se cierra la conexión y se reabre con la nueva.
+        """
+        inst = cls._instances.get(port)
+        if inst is None:
+            inst = cls._instances[port] = cls(port, baudrate, low_latency, fast)
+        elif (inst.baudrate, inst.low_latency, inst.fast) != (baudrate, low_latency, fast):
+            # La clave sigue siendo el puerto: dos instancias se pelearían por el lock
+            logging.debug("Reconfiguring connection to %s", port)
+            inst._cleanup()
+            inst.baudrate = baudrate
+            inst.low_latency = low_latency
+            inst.fast = fast
+        return inst
     
-    def get_connection(self) -> Optional[serial.Serial]:
+    def get_connection(self) -> Union[serial.Serial, _RawSerial, None]:
         """Obtiene la conexión persistente, creándola si es necesario."""
         
         # Si ya tenemos conexión activa, usarla
         if self._connection and self._connection.is_open:
             return self._connection
             
-        # Intentar obtener el lock
+        # Intentar obtener el lock. El lockfile se abre una sola vez ('a+' no
+        # lo trunca) y entre intentos solo se repite el flock
         try:
-            self._lockfile = open(self._lockfile_path, 'w')
+            if self._lockfile is None:
+                self._lockfile = open(self._lockfile_path, 'a+')
             fcntl.flock(self._lockfile.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
-            
+        except BlockingIOError:
+            # Otro proceso tiene el lock, la conexión ya existe
+            # Esperar un poco y reintentar
+            logging.debug("Another process holds the Arduino connection")
+            time.sleep(0.1)
+            return None
+        except OSError as e:
+            logging.error("Cannot lock %s: %s", self._lockfile_path, e)
+            return None
+
+        try:
             # Somos los únicos con el lock, crear conexión
-            logging.info(f"Acquiring persistent connection to {self.port}")
-            
-            self._connection = serial.Serial(
-                port=self.port,
-                baudrate=self.baudrate,
-                timeout=self.timeout,
-                write_timeout=self.timeout
-            )
-            
-            # Solo esperar reset la primera vez
-            time.sleep(2)
-            self._connection.reset_input_buffer()
-            self._connection.reset_output_buffer()
+            logging.info("Acquiring persistent connection to %s", self.port)
             
-            # Verificar que funciona
-            self._connection.write(b"ID\n")
-            self._connection.flush()
-            response = self._connection.readline().decode('utf-8', errors='ignore').strip()
+            if self.fast and self.port.startswith('/dev/'):
+                self._connection = _RawSerial(self.port, self.baudrate,
+                                              self.timeout, self.timeout)
+            else:
+                # DTR bajo apenas abierto. En Linux esto no evita el reset: el
+                # open() del kernel ya subió DTR (HUPCL) antes de que pyserial lo baje,
+                # por eso hay que esperar a que la placa conteste
+                self._connection = _serial().Serial(
+                    baudrate=self.baudrate,
+                    timeout=self.timeout,
+                    write_timeout=self.timeout,
+                    dsrdtr=False,
+                    rtscts=False
+                )
+                self._connection.port = self.port
+                self._connection.dtr = False
+                self._connection.open()
+            self._fd = self._connection.fileno()
+            if self.low_latency:
+                self._enable_low_latency()
             
-            if "RELAY-CTRL" not in response:
-                raise Exception(f"Invalid Arduino response: {response}")
+            # Esperar a que la placa salga del bootloader: sondear ID en lugar de
+            # esperar el reset a ciegas
+            response = self._wait_ready()
+            if response is None:
+                raise Exception("Invalid Arduino response: no ID reply within "
+                                f"{_READY_DEADLINE} s")
                 
             logging.info("Persistent Arduino connection established")
             return self._connection
             
-        except (IOError, OSError):
-            # Otro proceso tiene el lock, la conexión ya existe
-            # Esperar un poco y reintentar
-            logging.debug("Another process holds the Arduino connection")
-            time.sleep(0.1)
-            return None
-            
         except Exception as e:
-            logging.error(f"Failed to create persistent connection: {e}")
+            logging.error("Failed to create persistent connection: %s", e)
             self._cleanup()
             return None
     
-    def send_command(self, command: str) -> Optional[str]:
+    def _wait_ready(self) -> Optional[bytes]:
+        """Reintenta ID con timeouts cortos hasta que conteste o se agote el plazo."""
+        conn = self._connection
+        timeout = conn.timeout
+        conn.timeout = _PROBE_TIMEOUT
+        try:
+            deadline = time.monotonic() + _READY_DEADLINE
+            buf = bytearray()
+            # Descartar la basura del arranque una sola vez: buf ya acumula entre sondeos
+            conn.reset_input_buffer()
+            retried = False
+            while time.monotonic() < deadline:
+                conn.write(_CMD_BYTES[ArduinoCommands.ID])
+                window = time.monotonic() + _PROBE_TIMEOUT
+                while time.monotonic() < window:
+                    buf += conn.read(conn.in_waiting or 1)
+                    match = ID_RE.search(buf)
+                    if match:
+                        if retried and conn.in_waiting:
+                            # Respuestas tardías de sondeos anteriores
+                            conn.reset_input_buffer()
+                        return match.group(1)
+                retried = True
+                time.sleep(_PROBE_INTERVAL)
+            return None
+        finally:
+            conn.timeout = timeout
+
+    def _enable_low_latency(self) -> None:
+        """Baja el latency_timer del puente USB-serial (16 ms por defecto) a ~1 ms."""
+        try:
+            self._connection.set_low_latency_mode(True)
+            return
+        except (AttributeError, ValueError, OSError) as e:
+            # AttributeError: sin soporte fuera de Linux; ValueError: el driver
+            # rechazó TIOCSSERIAL
+            logging.debug("ASYNC_LOW_LATENCY not available on %s: %s", self.port, e)
+
+        # Alternativa para FTDI: escribir el latency_timer por sysfs si hay permisos
+        tty = os.path.basename(os.path.realpath(self.port))
+        try:
+            with open(f"/sys/bus/usb-serial/devices/{tty}/latency_timer", 'w') as f:
+                f.write("1")
+        except OSError as e:
+            logging.debug("Could not set latency_timer for %s: %s", tty, e)
+
+    def send_command(self, command: str) -> Optional[bytes]:
         """Envía un comando usando la conexión persistente."""
-        
+        return self.send_raw(f"{command}\n".encode('utf-8'))
+
+    def send_raw(self, cmd_bytes: bytes, wait: float = _REPLY_DEADLINE) -> Optional[bytes]:
+        """Envía un comando ya codificado (terminado en \\n) y devuelve la respuesta."""
         max_retries = 3
         for attempt in range(max_retries):
             conn = self.get_connection()
@@ -129,65 +384,157 @@ class PersistentArduinoController:
                 continue
                 
             try:
-                # Enviar comando
-                cmd_bytes = f"{command}\n".encode('utf-8')
+                # Enviar comando; sin flush(): su tcdrain() bloquea hasta que la UART
+                # termina de sacar los bits y la lectura posterior ya espera lo justo.
+                # write_timeout sigue protegiendo contra un buffer del kernel trabado
                 conn.write(cmd_bytes)
-                conn.flush()
                 
-                # Leer respuesta
-                response_lines = []
-                for _ in range(10):
-                    line = conn.readline().decode('utf-8', errors='ignore').strip()
-                    if line:
-                        response_lines.append(line)
-                        if any(term in line for term in ["STATUS", "ERR", "OK", "RELAY-CTRL"]):
-                            break
-                    else:
-                        break
-                        
-                response = '\n'.join(response_lines)
-                logging.debug(f"Command: {command} -> Response: {response}")
+                response = self._read_until_terminator(wait)
+                logging.debug("Command: %r -> Response: %r", cmd_bytes, response)
                 return response
                 
             except Exception as e:
-                logging.error(f"Error sending command (attempt {attempt+1}): {e}")
+                logging.error("Error sending command (attempt %d): %s", attempt + 1, e)
                 self._cleanup()
                 if attempt < max_retries - 1:
                     time.sleep(0.5)
                     
         return None
+
+    def exchange_many(self, commands: List[str]) -> List[Optional[str]]:
+        """Versión str de send_batch: una respuesta decodificada por comando."""
+        responses = self.send_batch([f"{c}\n".encode('utf-8') for c in commands])
+        return [r.decode('utf-8', errors='ignore') if r is not None else None
+                for r in responses]
+
+    def send_batch(self, commands: List[bytes]) -> List[Optional[bytes]]:
+        """
+        Envía varios comandos (terminados en \\n) con writev() en tramos que quepan
+        en el RX del Arduino y devuelve una respuesta por comando, en orden.
+        """
+        conn = self.get_connection()
+        if not conn:
+            return [None] * len(commands)
+
+        fd = self._fd
+        results: List[Optional[bytes]] = []
+        try:
+            for start, end in batch_spans(commands):
+                chunk = commands[start:end]
+                writev_all(fd, chunk, conn.write)
+                deadline = time.monotonic() + (conn.timeout or 0)
+                buf = self._read_select(fd, deadline, count=len(chunk))
+                results.extend(self._split_replies(buf, len(chunk)))
+        except Exception as e:
+            logging.error("Error sending batch: %s", e)
+            self._cleanup()
+        results.extend([None] * (len(commands) - len(results)))
+        return results
+
+    def _split_replies(self, buf: bytearray, count: int) -> List[Optional[bytes]]:
+        """Parte lo leído en hasta count respuestas, cada una cerrada por una línea terminal."""
+        search = _TERM_RE.search
+        replies: List[Optional[bytes]] = []
+        lines = []
+        for line in bytes(buf).splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            lines.append(line)
+            if search(line):
+                replies.append(b'\n'.join(lines))
+                lines = []
+                if len(replies) == count:
+                    break
+        replies.extend([None] * (count - len(replies)))
+        return replies
     
-    def _cleanup(self):
-        """Limpia la conexión y el lockfile."""
+    def _read_until_terminator(self, wait: float = _REPLY_DEADLINE) -> bytes:
+        """Lee en bloque hasta la primera línea terminal o hasta que pasen wait s."""
+        deadline = time.monotonic() + wait
+        buf = self._read_select(self._fd, deadline)
+
+        search = _TERM_RE.search
+        lines = []
+        for line in bytes(buf).splitlines():
+            line = line.strip()
+            if line:
+                lines.append(line)
+                if search(line):
+                    break
+        return b'\n'.join(lines)
+
+    def _read_select(self, fd: int, deadline: float, count: int = 1) -> bytearray:
+        """select() + os.read(): vuelve en cuanto llegan count líneas terminales."""
+        # Atributos resueltos una sola vez fuera de los bucles
+        search = _TERM_RE.search
+        monotonic = time.monotonic
+        wait = select.select
+
+        buf = bytearray()
+        while True:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            ready, _, _ = wait([fd], [], [], remaining)
+            if not ready:
+                break
+            try:
+                chunk = os.read(fd, 4096)
+            except BlockingIOError:
+                continue
+            if not chunk:
+                raise _serial().SerialException("Arduino disconnected (read returned no data)")
+            buf += chunk
+            end = buf.rfind(b"\n")
+            if end >= 0 and search(buf, 0, end):
+                if count == 1 or sum(
+                        1 for line in buf[:end].split(b"\n") if search(line)) >= count:
+                    break
+        return buf
+
+    def _cleanup(self, close_lockfile: bool = False):
+        """Cierra la conexión y suelta el lock; el lockfile queda abierto para reintentar."""
         if self._connection:
             try:
                 self._connection.close()
-            except:
+            except OSError:  # incluye serial.SerialException
                 pass
             self._connection = None
+            self._fd = None
             
         if self._lockfile:
             try:
                 fcntl.flock(self._lockfile.fileno(), fcntl.LOCK_UN)
-                self._lockfile.close()
-            except:
+                if close_lockfile:
+                    self._lockfile.close()
+            except OSError:
                 pass
-            self._lockfile = None
+            if close_lockfile:
+                self._lockfile = None
     
     def __del__(self):
-        self._cleanup()
+        self._cleanup(close_lockfile=True)
 
 
 # Actualizar la clase principal para usar el controlador persistente
 class ArduinoRelayController:
     """Interfaz compatible que usa conexión persistente internamente."""
     
-    def __init__(self, port: str = '/dev/arduino-relay', baudrate: int = 115200, timeout: float = 2.0):
+    def __init__(self, port: str = '/dev/arduino-relay', baudrate: int = 115200, timeout: float = 2.0,
+                 low_latency: bool = True, fast: bool = False):
         self.port = port
         self.baudrate = baudrate
         self.timeout = timeout
-        self._persistent = PersistentArduinoController(port, baudrate)
-        logger.info(f"Initialized ArduinoRelayController - Port: {port}, Baudrate: {baudrate}")
+        self._persistent = PersistentArduinoController.get_instance(
+            port, baudrate, low_latency, fast)
+        self.refresh_log_level()
+        logger.info("Initialized ArduinoRelayController - Port: %s, Baudrate: %d", port, baudrate)
+
+    def refresh_log_level(self) -> None:
+        """Recalcula los guards de logging; llamar si cambia el nivel del logger."""
+        self._dbg = logger.isEnabledFor(logging.DEBUG)
+        self._info = logger.isEnabledFor(logging.INFO)
 
     def connect(self) -> bool:
         """Conecta usando el controlador persistente."""
@@ -198,158 +545,172 @@ class ArduinoRelayController:
         pass
 
     def is_connected(self) -> bool:
-        """Verifica si hay conexión disponible."""
-        return self._persistent.get_connection() is not None
+        """Verifica si la conexión ya está abierta, sin intentar abrirla ni tomar el lock."""
+        conn = self._persistent._connection
+        return conn is not None and conn.is_open
 
     # -------- Single-channel helpers (kept for compatibility) --------
     def relay_on(self, channel: int) -> bool:
         self._validate_channel(channel)
-        logger.info(f"Turning ON relay channel {channel}")
-        return self._exec_and_ok(f"{ArduinoCommands.ON} {channel}")
+        if self._info:
+            logger.info("Turning ON relay channel %d", channel)
+        return self._exec_and_ok(_CMD_BYTES[ArduinoCommands.ON, channel])
 
     def relay_off(self, channel: int) -> bool:
         self._validate_channel(channel)
-        logger.info(f"Turning OFF relay channel {channel}")
-        return self._exec_and_ok(f"{ArduinoCommands.OFF} {channel}")
+        if self._info:
+            logger.info("Turning OFF relay channel %d", channel)
+        return self._exec_and_ok(_CMD_BYTES[ArduinoCommands.OFF, channel])
 
     # -------- Multi-channel helpers --------
     def relays_on(self, channels: Iterable[int]) -> bool:
         ch = self._validate_channels(channels)
-        logger.info(f"Turning ON relay channels {ch}")
-        return self._exec_and_ok(f"{ArduinoCommands.ON} " + " ".join(map(str, ch)))
+        if self._info:
+            logger.info("Turning ON relay channels %s", ch)
+        return self._exec_and_ok(_fmt_mask(ArduinoCommands.ON_MASK, _channel_mask(ch)))
 
     def relays_off(self, channels: Iterable[int]) -> bool:
         ch = self._validate_channels(channels)
-        logger.info(f"Turning OFF relay channels {ch}")
-        return self._exec_and_ok(f"{ArduinoCommands.OFF} " + " ".join(map(str, ch)))
+        if self._info:
+            logger.info("Turning OFF relay channels %s", ch)
+        return self._exec_and_ok(_fmt_mask(ArduinoCommands.OFF_MASK, _channel_mask(ch)))
 
     def relays_toggle(self, channels: Iterable[int]) -> bool:
         ch = self._validate_channels(channels)
-        logger.info(f"Toggling relay channels {ch}")
-        return self._exec_and_ok(f"{ArduinoCommands.TOGGLE} " + " ".join(map(str, ch)))
+        if self._info:
+            logger.info("Toggling relay channels %s", ch)
+        return self._exec_and_ok(_fmt_mask(ArduinoCommands.TOGGLE_MASK, _channel_mask(ch)))
 
     def pulse(self, channel: int, milliseconds: int) -> bool:
         self._validate_channel(channel)
         if not (1 <= milliseconds <= 60000):
             raise ValueError("Invalid milliseconds. Must be 1..60000")
-        logger.info(f"Pulsing relay {channel} for {milliseconds} ms")
-        return self._exec_and_ok(f"{ArduinoCommands.PULSE} {channel} {milliseconds}")
+        if self._info:
+            logger.info("Pulsing relay %d for %d ms", channel, milliseconds)
+        # La firmware contesta recién al terminar el pulso
+        return self._exec_and_ok(b"%s %d %d\n" % (ArduinoCommands.PULSE, channel, milliseconds),
+                                 wait=_REPLY_DEADLINE + milliseconds / 1000)
 
     # -------- Bulk helpers --------
     def all_relays_off(self) -> bool:
-        logger.info("Turning OFF all relays")
-        return self._exec_and_ok(ArduinoCommands.ALL_OFF)
+        if self._info:
+            logger.info("Turning OFF all relays")
+        return self._exec_and_ok(_CMD_BYTES[ArduinoCommands.ALL_OFF])
 
     def all_relays_on(self) -> bool:
-        logger.info("Turning ON all relays")
-        return self._exec_and_ok(ArduinoCommands.ALL_ON)
+        if self._info:
+            logger.info("Turning ON all relays")
+        return self._exec_and_ok(_CMD_BYTES[ArduinoCommands.ALL_ON])
+
+    def set_mask(self, mask: int) -> bool:
+        """Set all relays in one round-trip: bit i of mask drives channel i."""
+        if not 0 <= mask <= 0x3F:
+            raise ValueError("Invalid mask. Must be 0x00..0x3F")
+        if self._info:
+            logger.info("Setting relay mask 0x%02X", mask)
+        return self._exec_and_ok(b"%s %02X\n" % (ArduinoCommands.SET, mask))
+
+    def exec_batch(self, commands: List[bytes]) -> List[bool]:
+        """Ejecuta varios comandos crudos (p.ej. b"ON 0") en una pasada; un bool por comando."""
+        payloads = [cmd if cmd.endswith(b"\n") else cmd + b"\n" for cmd in commands]
+        # send_batch abre la conexión si hace falta; sin ella devuelve todo None
+        responses = self._persistent.send_batch(payloads)
+        if not self.is_connected():
+            logger.error("No active connection to Arduino")
+        if self._dbg:
+            logger.debug("Batch %r -> %r", payloads, responses)
+        return [self._is_success_response(r) for r in responses]
+
+    def relays_apply(self, ops: Iterable[Tuple[str, Iterable[int]]]) -> List[bool]:
+        """
+        Varias operaciones agrupadas, p.ej. [('on', [0, 1]), ('toggle', [5])], en un
+        solo lote: cada una viaja como su comando de máscara y se escriben juntas.
+        """
+        payloads = []
+        for op, channels in ops:
+            mask_op = _MASK_OPS.get(op)
+            if mask_op is None:
+                raise ValueError(f"Invalid operation {op!r}. Must be on/off/toggle")
+            payloads.append(_fmt_mask(mask_op, _channel_mask(self._validate_channels(channels))))
+        return self.exec_batch(payloads)
 
     # -------- Status --------
     def get_status(self) -> Optional[Dict[str, Any]]:
-        logger.debug("Requesting relay status")
-        if self._send_command(ArduinoCommands.STATUS):
-            response = self._read_response()
-            if response:
-                logger.debug(f"Status response received: {response}")
-                return self._parse_status_response(response)
+        if self._dbg:
+            logger.debug("Requesting relay status")
+        response = self._exchange(_CMD_BYTES[ArduinoCommands.STATUS])
+        if response:
+            if self._dbg:
+                logger.debug("Status response received: %r", response)
+            return self._parse_status_response(response)
         logger.error("Failed to get relay status")
         return None
 
     # -------- Internals --------
-    def _exec_and_ok(self, command: str) -> bool:
-        if self._send_command(command):
-            response = self._read_response()
-            if self._is_success_response(response):
-                logger.debug(f"OK: {response}")
-                return True
-            logger.error(f"Command failed. Resp: {response}")
+    def _exec_and_ok(self, command: bytes, wait: float = _REPLY_DEADLINE) -> bool:
+        response = self._exchange(command, wait)
+        if response is None:
+            return False
+        if self._is_success_response(response):
+            if self._dbg:
+                logger.debug("OK: %r", response)
+            return True
+        logger.error("Command failed. Resp: %r", response)
         return False
 
     def _validate_channel(self, channel: int) -> None:
-        if not 0 <= channel <= 5:
+        if channel not in _CHANNEL_SET:
             raise ValueError(f"Invalid channel {channel}. Must be 0-5")
 
-    def _validate_channels(self, channels: Iterable[int]) -> List[int]:
-        ch_list = list(channels)
-        if not ch_list:
+    def _validate_channels(self, channels: Iterable[int]) -> Tuple[int, ...]:
+        # Una sola pasada de int(); la tupla no se redimensiona
+        ch = tuple(int(c) for c in channels)
+        if not ch:
             raise ValueError("No channels provided")
-        for c in ch_list:
-            self._validate_channel(int(c))
-        return [int(c) for c in ch_list]
-
-    def _send_command(self, command: str) -> bool:
-        if not self.is_connected():
-            logger.error("No active connection to Arduino")
-            return False
+        for c in ch:
+            if c not in _CHANNEL_SET:
+                raise ValueError(f"Invalid channel {c}. Must be 0-5")
+        return ch
+
+    def _exchange(self, command: bytes, wait: float = _REPLY_DEADLINE) -> Optional[bytes]:
+        """Un write y una lectura hasta la línea terminal; None si no hay conexión."""
+        # send_raw ya obtiene (o abre) la conexión: no consultarla dos veces
         try:
-            cmd_bytes = f"{command}\n".encode('utf-8')
-            self._persistent.send_command(command) # Use persistent send_command
-            logger.debug(f"Command sent: {command}")
-            return True
+            response = self._persistent.send_raw(command, wait)
         except Exception as e:
-            logger.error(f"Error sending command '{command}': {e}")
-            return False
-
-    def _read_response(self, max_lines: int = 10) -> Optional[str]:
-        if not self.is_connected():
-            logger.error("No active connection to Arduino")
+            logger.error("Error sending command %r: %s", command, e)
             return None
-        try:
-            response_lines = []
-            for _ in range(max_lines):
-                line = self._persistent.send_command("STATUS") # Use persistent send_command
-                if line:
-                    response_lines.append(line)
-                    # Stop early on clear terminators
-                    if any(ind in line for ind in (
-                        ArduinoResponses.STATUS_OK,
-                        ArduinoResponses.ERROR,
-                        ArduinoResponses.OK,
-                        ArduinoResponses.DEVICE_ID
-                    )):
-                        break
-                else:
-                    break
-            response = '\n'.join(response_lines) if response_lines else None
-            logger.debug(f"Response received:\n{response}")
-            return response
-        except Exception as e:
-            logger.error(f"Error reading response: {e}")
+        if response is None and not self.is_connected():
+            logger.error("No active connection to Arduino")
             return None
+        if self._dbg:
+            logger.debug("Exchange %r -> %r", command, response)
+        return response
 
-    def _is_success_response(self, response: Optional[str]) -> bool:
+    def _is_success_response(self, response: Optional[bytes]) -> bool:
         if not response:
             return False
-        # STATUS lines after commands are considered OK if they don't include ERR
-        return (ArduinoResponses.STATUS_OK in response or
-                ArduinoResponses.OK in response or
-                ArduinoResponses.DEVICE_ID in response) and \
-               ArduinoResponses.ERROR not in response
+        # STATUS lines after commands are considered OK if they don't include ERR.
+        # ERR goes first: in the common success case it is the only full scan.
+        return ArduinoResponses.ERROR not in response and _SUCCESS_RE.search(response) is not None
 
-    def _parse_status_response(self, response: str) -> Dict[str, Any]:
+    def _parse_status_response(self, response: bytes) -> Dict[str, Any]:
         """
         Expected STATUS format (from Arduino):
           STATUS 0:OFF 1:ON 2:OFF 3:OFF 4:ON 5:OFF
         """
-        status_line = None
-        for line in response.splitlines():
-            if line.startswith(ArduinoResponses.STATUS_OK):
-                status_line = line
-                break
         channels: Dict[int, bool] = {}
-        if status_line:
-            parts = status_line.split()[1:]  # skip "STATUS"
-            for tok in parts:
-                if ':' in tok:
-                    idx, val = tok.split(':', 1)
-                    try:
-                        ch = int(idx)
-                        channels[ch] = (val.upper() == 'ON')
-                    except ValueError:
-                        continue
+        prefix = ArduinoResponses.STATUS_OK + b" "
+        start = response.find(prefix)
+        if start >= 0:
+            # Solo la línea STATUS, partida en tokens y resuelta por tabla
+            end = response.find(b"\n", start)
+            line = response[start + len(prefix):end if end >= 0 else None]
+            channels = dict(_TOKEN_STATE[tok] for tok in line.split() if tok in _TOKEN_STATE)
         return {
-            'raw_response': response,
-            'timestamp': time.time(),
+            # Solo decodificar la respuesta cruda si alguien la va a registrar
+            'raw_response': (response.decode('utf-8', errors='ignore')
+                             if self._dbg else None),
             'connected': True,
             'channels': channels
         }
@@ -367,39 +728,119 @@ class ArduinoRelayController:
         self.disconnect()
 
 
+
+
 class DaemonClient:
-    """Cliente simple para comunicarse con el daemon."""
+    """Cliente simple para comunicarse con el daemon; reutiliza una conexión."""
     
-    def __init__(self, socket_path: str = "/tmp/arduino-relay.sock"):
+    def __init__(self, socket_path: str = "\0arduino-relay"):
         self.socket_path = socket_path
-    
-    def is_daemon_running(self) -> bool:
-        """Verifica si el daemon está corriendo."""
-        try:
-            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
-                sock.settimeout(1.0)
-                sock.connect(self.socket_path)
-                return True
-        except:
-            return False
+        self._sock: Optional[socket.socket] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
     
     def send_command(self, command: str) -> dict:
-        """Envía comando al daemon."""
+        """
+        Envía comando al daemon. Si no hay daemon escuchando el resultado trae
+        "errno" (ENOENT/ECONNREFUSED): el connect falló antes de enviar nada.
+        """
         try:
-            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            # Trama "<comando>" -> trama "OK <respuesta>" | "ERR <motivo>"
+            reply = self._call(command.encode('ascii'))
+            return self._parse_reply(reply.decode('utf-8', errors='ignore').strip())
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            return {"success": False, "error": str(e), "errno": e.errno}
+        except (OSError, EOFError, UnicodeError) as e:
+            # socket.timeout es OSError; UnicodeError si el comando no es ASCII
+            return {"success": False, "error": str(e)}
+
+    def _get_sock(self) -> socket.socket:
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
                 sock.settimeout(5.0)
                 sock.connect(self.socket_path)
-                
-                request = {"command": command}
-                sock.send(json.dumps(request).encode('utf-8'))
-                
-                response_data = sock.recv(4096)
-                return json.loads(response_data.decode('utf-8'))
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+            except OSError:
+                sock.close()
+                raise
+            self._sock = sock
+        return self._sock
+
+    def _call(self, payload: bytes) -> bytes:
+        frame = FRAME.pack(len(payload)) + payload
+        try:
+            self._get_sock().sendall(frame, socket.MSG_NOSIGNAL)
+        except (BrokenPipeError, ConnectionResetError):
+            # El daemon se reinició: la conexión guardada ya no sirve. Reintentar
+            # solo si el envío falló; tras un envío completo el comando pudo ejecutarse
+            self.close()
+            self._get_sock().sendall(frame, socket.MSG_NOSIGNAL)
+        try:
+            (length,) = FRAME.unpack(self._recv_all(FRAME.size))
+            return self._recv_all(length)
+        except BaseException:
+            self.close()
+            raise
+
+    def _recv_all(self, n: int) -> bytes:
+        # recv puede devolver menos de lo pedido: leer hasta completar la trama
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = self._sock.recv(n - len(buf))
+            if not chunk:
+                raise EOFError("daemon closed the connection")
+            buf += chunk
+        return bytes(buf)
+
+    @staticmethod
+    def unavailable(result: dict) -> bool:
+        """True si send_command no llegó a hablar con un daemon."""
+        return result.get("errno") in (errno.ENOENT, errno.ECONNREFUSED)
+
+    def send_batch(self, commands: List[str]) -> List[dict]:
+        """Envía varios comandos en un solo BATCH; una respuesta por comando, en orden."""
+        try:
+            payload = "BATCH\n" + "".join(f"{c}\n" for c in commands) + ".\n"
+            reply = self._call(payload.encode('ascii'))
+            results = [self._parse_reply(line.strip())
+                       for line in reply.decode('utf-8', errors='ignore').splitlines()]
+        except (OSError, EOFError, UnicodeError) as e:
+            return [{"success": False, "error": str(e)} for _ in commands]
+        missing = {"success": False, "error": "Empty reply from daemon"}
+        return results[:len(commands)] + [missing] * (len(commands) - len(results))
+
+    @staticmethod
+    def _parse_reply(reply: str) -> dict:
+        status, _, payload = reply.partition(" ")
+        if status == "OK":
+            return {"success": True, "response": payload}
+        return {"success": False, "error": payload or "Empty reply from daemon"}
+
+
+def _parse_mask(value: str) -> int:
+    import argparse
+
+    try:
+        mask = int(value, 0)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid mask: {value!r}")
+    if not 0 <= mask <= 0x3F:
+        raise argparse.ArgumentTypeError(f"mask out of range (0x00..0x3F): {value}")
+    return mask
 
 
 def create_argument_parser() -> argparse.ArgumentParser:
+    import argparse
+
     parser = argparse.ArgumentParser(
         description="Arduino Relay Controller for labgrid integration",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -411,7 +852,9 @@ Usage Examples:
   %(prog)s pulse 1 500             # Pulse channel 1 for 500 ms
   %(prog)s all-on                  # Turn ON all relays
   %(prog)s all-off                 # Turn OFF all relays
+  %(prog)s mask 0x0B               # Channels 0,1,3 ON, the rest OFF (one command)
   %(prog)s status                  # Show status of all relays
+  %(prog)s daemon                  # Keep the port open and serve later calls
   %(prog)s --port /dev/ttyUSB0 on 0 1  # Use custom port
 
 Exit Codes:
@@ -429,6 +872,10 @@ Exit Codes:
                         help='Serial communication speed (default: 115200)')
     parser.add_argument('--timeout', type=float, default=2.0,
                         help='Communication timeout in seconds (default: 2.0)')
+    parser.add_argument('--low-latency', action=argparse.BooleanOptionalAction, default=True,
+                        help='Request ASYNC_LOW_LATENCY on the USB-serial bridge (default: on)')
+    parser.add_argument('--fast', action='store_true',
+                        help='Drive /dev/* ports through raw termios I/O instead of pyserial')
     parser.add_argument('--verbose', '-v', action='store_true',
                         help='Enable verbose logging output')
 
@@ -436,26 +883,31 @@ Exit Codes:
 
     # ON
     on_parser = subparsers.add_parser('on', help='Turn ON one or more channels')
-    on_parser.add_argument('channels', nargs='+', type=int, choices=range(6),
+    on_parser.add_argument('channels', nargs='+', type=int, choices=_CHANNELS,
                            help='Relay channels (0-5). Multiple allowed.')
 
     # OFF
     off_parser = subparsers.add_parser('off', help='Turn OFF one or more channels')
-    off_parser.add_argument('channels', nargs='+', type=int, choices=range(6),
+    off_parser.add_argument('channels', nargs='+', type=int, choices=_CHANNELS,
                             help='Relay channels (0-5). Multiple allowed.')
 
     # TOGGLE
     tog_parser = subparsers.add_parser('toggle', help='Toggle one or more channels')
-    tog_parser.add_argument('channels', nargs='+', type=int, choices=range(6),
+    tog_parser.add_argument('channels', nargs='+', type=int, choices=_CHANNELS,
                             help='Relay channels (0-5). Multiple allowed.')
 
     # PULSE
     pulse_parser = subparsers.add_parser('pulse', help='Pulse a channel for ms')
-    pulse_parser.add_argument('channel', type=int, choices=range(6),
+    pulse_parser.add_argument('channel', type=int, choices=_CHANNELS,
                               help='Relay channel (0-5)')
     pulse_parser.add_argument('milliseconds', type=int,
                               help='Pulse width in milliseconds (1..60000)')
 
+    # MASK
+    mask_parser = subparsers.add_parser('mask', help='Set all channels at once from a bitmask')
+    mask_parser.add_argument('mask', type=_parse_mask,
+                             help='Bit i drives channel i, hex or decimal (0x00..0x3F)')
+
     # STATUS
     subparsers.add_parser('status', help='Show status of all relay channels')
 
@@ -463,73 +915,120 @@ Exit Codes:
     subparsers.add_parser('all-on', help='Turn ON all relay channels')
     subparsers.add_parser('all-off', help='Turn OFF all relay channels')
 
+    # DAEMON
+    subparsers.add_parser('daemon', help='Run the relay daemon in the foreground; '
+                                         'later invocations are served through its socket')
+
     return parser
 
 
+def _configure_logging(verbose: bool) -> None:
+    logging.basicConfig(
+        level=logging.DEBUG if verbose else logging.WARNING,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+# Acciones que el camino rápido reenvía al daemon sin pasar por argparse
+_FAST_ACTIONS = {
+    'on': b"ON", 'off': b"OFF", 'toggle': b"TOGGLE",
+    'status': b"STATUS", 'all-on': b"ALLON", 'all-off': b"ALLOFF",
+}
+
+# _fast_main ya probó el daemon y no había: main() no vuelve a intentarlo
+_NO_DAEMON: Final = object()
+
+def _fast_main(argv: List[str]) -> Union[int, object, None]:
+    """
+    Atiende "on/off/toggle <canales>" y "status/all-on/all-off" directo contra el
+    daemon. Devuelve None si argv no es uno de esos casos y _NO_DAEMON si no hay
+    daemon; en ambos main() sigue por argparse.
+    """
+    if not argv or argv[0] not in _FAST_ACTIONS:
+        return None
+    action, rest = argv[0], argv[1:]
+    if action in ('on', 'off', 'toggle'):
+        if not rest or not all(a in ('0', '1', '2', '3', '4', '5') for a in rest):
+            return None
+    elif rest:
+        return None
+
+    cmd = ' '.join([_FAST_ACTIONS[action].decode()] + rest)
+    with DaemonClient() as client:
+        result = client.send_command(cmd)
+    if DaemonClient.unavailable(result):
+        return _NO_DAEMON
+    _configure_logging(False)
+    return _report_daemon_result(result, print_response=(action == 'status'))
+
 def main() -> int:
+    fast = _fast_main(sys.argv[1:])
+    if isinstance(fast, int):
+        return fast
+
     parser = create_argument_parser()
     args = parser.parse_args()
-
-    if args.verbose:
-        logging.getLogger().setLevel(logging.DEBUG)
+    _configure_logging(args.verbose)
 
     if not args.action:
         parser.print_help()
         return 3
 
-    # Detectar si el daemon está corriendo
-    daemon_client = DaemonClient()
-    use_daemon = daemon_client.is_daemon_running()
-    
-    if use_daemon:
-        logger.info("Using Arduino daemon (no reset)")
-        return _execute_via_daemon(args, daemon_client)
-    else:
-        logger.info("Using direct connection (may cause reset)")
-        return _execute_direct(args)
-
-def _execute_via_daemon(args, daemon_client: DaemonClient) -> int:
-    """Ejecuta comandos vía daemon."""
-    try:
-        # Construir comando para el daemon
-        if args.action == 'on':
-            cmd = f"ON {' '.join(map(str, args.channels))}"
-        elif args.action == 'off':
-            cmd = f"OFF {' '.join(map(str, args.channels))}"
-        elif args.action == 'toggle':
-            cmd = f"TOGGLE {' '.join(map(str, args.channels))}"
-        elif args.action == 'pulse':
-            cmd = f"PULSE {args.channel} {args.milliseconds}"
-        elif args.action == 'status':
-            cmd = "STATUS"
-        elif args.action == 'all-off':
-            cmd = "ALLOFF"
-        elif args.action == 'all-on':
-            cmd = "ALLON"
-        else:
-            return 3
-            
-        # Enviar al daemon
-        result = daemon_client.send_command(cmd)
-        
-        if result.get("success", False):
-            if args.action == 'status':
-                print(result.get("response", ""))
-            return 0
-        else:
-            logger.error(f"Daemon command failed: {result.get('error', 'Unknown error')}")
-            return 2
-            
-    except Exception as e:
-        logger.error(f"Error communicating with daemon: {e}")
-        return 2
+    if args.action == 'daemon':
+        return _run_daemon(args)
+
+    # Probar primero el daemon: el mismo connect sirve de chequeo de vida
+    cmd = _daemon_command(args) if fast is not _NO_DAEMON else None
+    if cmd is not None:
+        with DaemonClient() as client:
+            result = client.send_command(cmd)
+        if not DaemonClient.unavailable(result):
+            logger.info("Using Arduino daemon (no reset)")
+            return _report_daemon_result(result, print_response=(args.action == 'status'))
+
+    logger.info("Using direct connection (may cause reset)")
+    return _execute_direct(args)
+
+def _run_daemon(args) -> int:
+    """Mantiene el Arduino abierto y atiende los comandos que llegan por el socket."""
+    from arduino_daemon import ArduinoRelayDaemon
+
+    daemon = ArduinoRelayDaemon(arduino_port=args.port)
+    return 1 if daemon.start() is False else 0
+
+# Acción -> comando de línea del daemon: texto fijo o función de los args
+_CMD_BUILDERS = {
+    'on': lambda a: "ON " + " ".join(map(str, a.channels)),
+    'off': lambda a: "OFF " + " ".join(map(str, a.channels)),
+    'toggle': lambda a: "TOGGLE " + " ".join(map(str, a.channels)),
+    'pulse': lambda a: f"PULSE {a.channel} {a.milliseconds}",
+    'mask': lambda a: f"SET {a.mask:02X}",
+    'status': "STATUS",
+    'all-off': "ALLOFF",
+    'all-on': "ALLON",
+}
+
+def _daemon_command(args) -> Optional[str]:
+    """Comando de línea del daemon para la acción pedida (None si no tiene)."""
+    builder = _CMD_BUILDERS.get(args.action)
+    return builder(args) if callable(builder) else builder
+
+def _report_daemon_result(result: dict, print_response: bool) -> int:
+    """Traduce la respuesta del daemon a código de salida e imprime si se pidió."""
+    if result.get("success", False):
+        if print_response:
+            print(result.get("response", ""))
+        return 0
+    logger.error("Daemon command failed: %s", result.get('error', 'Unknown error'))
+    return 2
 
 def _execute_direct(args) -> int:
     """Ejecuta comandos directamente (metodo original)."""
     controller = ArduinoRelayController(
         port=args.port,
         baudrate=args.baudrate,
-        timeout=args.timeout
+        timeout=args.timeout,
+        low_latency=args.low_latency,
+        fast=args.fast
     )
     if not controller.connect():
         logger.error("Failed to connect to Arduino device")
@@ -560,8 +1059,13 @@ def _execute_direct(args) -> int:
             success = status is not None
             if success and status:
                 ch_map = status.get('channels', {})
-                pretty = ' '.join(f'{k}:{ "ON" if v else "OFF"}' for k, v in sorted(ch_map.items()))
-                print(f"STATUS {pretty}" if pretty else status['raw_response'])
+                if ch_map:
+                    # Plantilla fija de 6 canales, escrita en bytes sin pasar por print()
+                    sys.stdout.buffer.write(b"STATUS " + b" ".join(
+                        _STATE_TOKENS[c][bool(ch_map.get(c))] for c in _CHANNELS) + b"\n")
+                else:
+                    logger.error("Unexpected STATUS response from Arduino")
+                    success = False
 
         elif args.action == 'all-off':
             success = controller.all_relays_off()
@@ -569,13 +1073,16 @@ def _execute_direct(args) -> int:
         elif args.action == 'all-on':
             success = controller.all_relays_on()
 
+        elif args.action == 'mask':
+            success = controller.set_mask(args.mask)
+
         return 0 if success else 2
 
     except ValueError as e:
-        logger.error(f"Invalid argument: {e}")
+        logger.error("Invalid argument: %s", e)
         return 3
     except Exception as e:
-        logger.error(f"Unexpected error: {e}")
+        logger.error("Unexpected error: %s", e)
         return 2
     finally:
         controller.disconnect()
@@ -3,62 +3,126 @@
 Script para verificar comunicación serial con router
 """
 
+import atexit
 import serial
 import time
 import sys
 import argparse
 
-def test_communication(port, baudrate=115200, timeout=2):
+# Enters para despertar la consola y el echo, en una sola escritura
+_PROBE = b'\r\n\r\n\r\necho "ROUTER_TEST_OK"\r\n'
+# Salida del echo: a principio de línea, para no confundirla con el eco
+# del propio comando que devuelve la consola
+_MARKER = b'\nROUTER_TEST_OK'
+
+# Puertos ya abiertos por (port, baudrate): reabrir reconfigura el puerto y en
+# muchos puentes USB-serie mueve DTR/RTS, lo que reinicia el router
+_PORT_CACHE = {}
+
+
+def _close_all():
+    for ser in _PORT_CACHE.values():
+        try:
+            ser.close()
+        except Exception:
+            pass
+    _PORT_CACHE.clear()
+
+
+atexit.register(_close_all)
+
+
+def _get_port(port, baudrate, timeout):
+    ser = _PORT_CACHE.get((port, baudrate))
+    if ser is not None and ser.is_open:
+        if ser.timeout != timeout:
+            ser.timeout = timeout
+        return ser
+
+    ser = serial.Serial(
+        baudrate=baudrate,
+        bytesize=serial.EIGHTBITS,
+        parity=serial.PARITY_NONE,
+        stopbits=serial.STOPBITS_ONE,
+        timeout=timeout,
+        xonxoff=False,
+        rtscts=False,
+        dsrdtr=False
+    )
+    # Sin port no abre todavía: DTR/RTS quedan bajos apenas abierto. En Linux el
+    # open() del kernel igual los sube un instante (HUPCL); lo que evita el
+    # reset en las pruebas siguientes es no volver a abrir el puerto
+    ser.port = port
+    ser.dtr = False
+    ser.rts = False
+    ser.open()
+    _PORT_CACHE[(port, baudrate)] = ser
+    return ser
+
+
+def test_communication(port, baudrate=115200, timeout=2, compat=False):
     """
     Prueba la comunicación serial con el router.
 
     Args:
         port: Puerto serial (ej: /dev/glinet-mango)
         baudrate: Velocidad de comunicación
-        timeout: Timeout para operaciones
+        timeout: Timeout para operaciones (y plazo para ver la respuesta)
+        compat: Usar la secuencia lenta original (Enters espaciados y esperas fijas)
 
     Returns:
         tuple: (success, response_text)
     """
     try:
-        ser = serial.Serial(
-            port=port,
-            baudrate=baudrate,
-            bytesize=serial.EIGHTBITS,
-            parity=serial.PARITY_NONE,
-            stopbits=serial.STOPBITS_ONE,
-            timeout=timeout,
-            xonxoff=False,
-            rtscts=False,
-            dsrdtr=False
-        )
-
-        # Limpiar buffers
+        ser = _get_port(port, baudrate, timeout)
+
+        # Limpiar lo recibido antes de abrir; la salida está vacía porque aún
+        # no se escribió nada
         ser.reset_input_buffer()
-        ser.reset_output_buffer()
 
-        # Esperar y enviar Enter varias veces
-        time.sleep(1)
-        for i in range(5):
-            ser.write(b'\r\n')
+        if compat:
+            response = _probe_compat(ser)
+        else:
+            # Todo de una vez y leer hasta ver el marcador o vencer el plazo
+            ser.write(_PROBE)
             ser.flush()
-            time.sleep(0.5)
-
-        # Enviar comando de prueba
-        ser.write(b'echo "ROUTER_TEST_OK"\r\n')
-        ser.flush()
-        time.sleep(1)
-
-        # Leer respuesta
-        response = ser.read(500).decode('utf-8', errors='ignore')
-        ser.close()
-
+            deadline = time.monotonic() + timeout
+            buf = bytearray()
+            while time.monotonic() < deadline:
+                buf += ser.read(ser.in_waiting or 1)
+                if _MARKER in buf:
+                    break
+            response = buf.decode('utf-8', errors='ignore')
+
+        # El puerto queda abierto en _PORT_CACHE para la próxima prueba
         return True, response.strip()
 
     except Exception as e:
+        # Un puerto que falló no se reutiliza
+        ser = _PORT_CACHE.pop((port, baudrate), None)
+        if ser is not None:
+            ser.close()
         return False, str(e)
 
 
+def _probe_compat(ser):
+    """Secuencia original, para consolas que pierden caracteres si se les escribe de corrido."""
+    # Esperar y enviar Enter varias veces
+    time.sleep(1)
+    for i in range(5):
+        ser.write(b'\r\n')
+        ser.flush()
+        time.sleep(0.5)
+
+    # Enviar comando de prueba
+    ser.write(b'echo "ROUTER_TEST_OK"\r\n')
+    ser.flush()
+    time.sleep(1)
+
+    # Leer respuesta
+    return ser.read(500).decode('utf-8', errors='ignore')
+
+
 def main():
     """Función principal para uso desde línea de comandos."""
     parser = argparse.ArgumentParser(description="Verificar comunicación serial con router")
@@ -66,10 +130,12 @@ def main():
     parser.add_argument('--baudrate', type=int, default=115200, help='Velocidad de comunicación')
     parser.add_argument('--timeout', type=float, default=2.0, help='Timeout para operaciones')
     parser.add_argument('--verbose', '-v', action='store_true', help='Mostrar respuesta completa')
+    parser.add_argument('--compat', action='store_true',
+                        help='Secuencia lenta original (Enters espaciados, ~3.5 s)')
 
     args = parser.parse_args()
 
-    success, response = test_communication(args.port, args.baudrate, args.timeout)
+    success, response = test_communication(args.port, args.baudrate, args.timeout, args.compat)
 
     if success and response:
         print('✅ Router responde por serial')
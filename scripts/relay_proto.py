@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Protocolo compartido por arduino_relay_control y arduino_daemon: respuesta a ID,
+lotes por writev() y trama de las conexiones persistentes al daemon.
+"""
+
+import os
+import re
+import struct
+from typing import Callable, Iterator, List, Tuple
+
+# Respuesta a ID (el banner de arranque "OK RELAY-CTRL ..." no cuenta)
+ID_RE = re.compile(rb"(?:^|\n)(RELAY-CTRL[^\r\n]*)\r?\n")
+
+# Tope de bytes por writev() en un lote (el RX del Arduino es de 64)
+BATCH_BYTES = 60
+
+# Trama del daemon para conexiones persistentes: longitud "!I" + payload
+FRAME = struct.Struct("!I")
+
+
+def batch_spans(commands: List[bytes], limit: int = BATCH_BYTES) -> Iterator[Tuple[int, int]]:
+    """Tramos [start, end) de commands que suman hasta limit bytes; uno más largo va solo."""
+    start = 0
+    while start < len(commands):
+        end = start + 1
+        size = len(commands[start])
+        while end < len(commands) and size + len(commands[end]) <= limit:
+            size += len(commands[end])
+            end += 1
+        yield start, end
+        start = end
+
+
+def writev_all(fd: int, parts: List[bytes], write: Callable[[bytes], object]) -> None:
+    """Varios comandos en una sola syscall; lo que no entró en el tty lo termina write."""
+    try:
+        written = os.writev(fd, parts)
+    except BlockingIOError:
+        written = 0
+    if written < sum(map(len, parts)):
+        write(b"".join(parts)[written:])